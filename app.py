@@ -2,6 +2,7 @@ from flask import Flask, render_template, request, redirect, url_for, session, f
 import mysql.connector as mysql
 import re
 import os
+from datetime import date, datetime, timedelta
 from functools import wraps
 
 app = Flask(__name__)
@@ -141,6 +142,7 @@ def book_ticket():
         s = "SELECT * FROM traind"
         xo.execute(s)
         trains = xo.fetchall()
+        stations = all_stations(trains)
 
         if request.method == 'POST':
             try:
@@ -152,26 +154,31 @@ def book_ticket():
                 age = request.form['passenger_age']
                 phonenum = request.form['phone_number']
                 tid = request.form['train_id']
+                startingpoint = request.form['boarding_point']
+                journey_date = parse_date(request.form['journey_date'])
 
                 # Input validation
                 if not (1 <= tic <= len(class_coaches)):
                     flash("Invalid class coach selection.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
                 if tickets <= 0:
                     flash("Number of tickets must be positive.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
                 if not (1 <= ddd <= len(destinations)): # Assuming DNo starts from 1 and is sequential
                     flash("Invalid destination selection.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
                 if not age.isdigit() or int(age) <= 0:
                     flash("Invalid age, please enter a numeric value.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
                 if not re.match("^\d+$", phonenum):
                     flash("Invalid phone number, please enter digits only.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
                 if not tid.isdigit():
                     flash("Invalid Train ID, please enter a numeric value.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
+                if journey_date < date.today():
+                    flash("Journey date cannot be in the past.", 'error')
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
 
                 # Calculate total cost based on class coach
                 tot = 0
@@ -183,19 +190,42 @@ def book_ticket():
                     tot = 6000 * tickets
                 else:
                     flash("Invalid class coach selection.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
 
                 # Get selected destination cost
                 selected_destination_info = next((d for d in destinations if d[0] == ddd), None)
                 if selected_destination_info:
                     selected_destination_name = selected_destination_info[1]
                     destination_cost = selected_destination_info[2]
-                    tot += tickets * destination_cost
                 else:
                     flash("Selected destination not found.", 'error')
-                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
-
-                startingpoint = "Coimbatore" # Default value as in original script
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
+
+                # Find and lock the train's run on the journey date, so the run
+                # cannot be rebuilt or cancelled while seats are reserved on it
+                sql = "SELECT run_id FROM train_run WHERE tid = %s AND run_date = %s FOR UPDATE"
+                xo.execute(sql, (int(tid), journey_date))
+                run = xo.fetchone()
+                if not run:
+                    flash(f"Train {tid} does not run on {journey_date}.", 'error')
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
+                run_id = run[0]
+
+                seg_range = find_segment_range(run_stops(xo, run_id), startingpoint, selected_destination_name)
+                if not seg_range:
+                    flash(f"Train {tid} does not travel from {startingpoint} to {selected_destination_name}.", 'error')
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
+
+                fare = journey_fare(destinations, startingpoint, destination_cost)
+                if fare is None:
+                    flash(f"No fare is available from {startingpoint} to {selected_destination_name}.", 'error')
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
+                tot += tickets * fare
+
+                if not reserve_seats(xo, run_id, seg_range, tickets):
+                    con.rollback()
+                    flash(f"Not enough seats available on {journey_date} from {startingpoint} to {selected_destination_name}.", 'error')
+                    return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
 
                 # Prepare data for insertion
                 passenger_data = (
@@ -206,13 +236,15 @@ def book_ticket():
                     tot,
                     tickets,
                     int(tid),
-                    selected_destination_name
+                    selected_destination_name,
+                    journey_date,
+                    run_id
                 )
 
-                # Insert into passenger table
+                # Insert into passenger table; seats and booking are committed together
                 sql = """
-                    INSERT INTO passenger (name, age, phonenum, reg_date, startingpoint, totalcost, tickets, tid, destination)
-                    VALUES (%s, %s, %s, CURRENT_DATE, %s, %s, %s, %s, %s)
+                    INSERT INTO passenger (name, age, phonenum, reg_date, startingpoint, totalcost, tickets, tid, destination, travel_date, run_id)
+                    VALUES (%s, %s, %s, CURRENT_DATE, %s, %s, %s, %s, %s, %s, %s)
                 """
                 xo.execute(sql, passenger_data)
                 con.commit()
@@ -221,14 +253,15 @@ def book_ticket():
                 return redirect(url_for('show_passengers')) # Redirect to show all passengers after booking
 
             except ValueError:
-                flash("Please enter valid numeric values for age, phone number, tickets, and IDs.", 'error')
+                flash("Please enter valid numeric values for age, phone number, tickets, and IDs, and a valid journey date.", 'error')
             except mysql.Error as e:
+                con.rollback()
                 flash(f"Error during ticket booking: {e}", 'error')
             finally:
                 if con.is_connected():
                     con.close()
 
-        return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains)
+        return render_template('book_ticket.html', class_coaches=class_coaches, destinations=destinations, trains=trains, stations=stations)
 
     except mysql.Error as e:
         flash(f"Error fetching data for booking: {e}", 'error')
@@ -251,7 +284,7 @@ def show_passengers():
     passengers = []
     try:
         xo = con.cursor()
-        s = "SELECT pno, name, age, phonenum, totalcost, tickets, tid, startingpoint, destination, reg_date FROM passenger"
+        s = "SELECT pno, name, age, phonenum, totalcost, tickets, tid, startingpoint, destination, reg_date, travel_date FROM passenger"
         xo.execute(s)
         passengers = xo.fetchall()
     except mysql.Error as e:
@@ -309,6 +342,287 @@ def show_train_details():
             con.close()
     return render_template('show_train_details.html', trains=trains)
 
+# --- Train Schedule ---
+# A train "run" is one departure of a traind train on a given date. Each run is
+# split into segments between consecutive stops, and every segment keeps a
+# counter of booked seats. A journey from A to B occupies the segments between
+# them, so its free seats are capacity minus the busiest of those segments.
+ORIGIN_STATION = "Coimbatore" # Every train departs from here, as in the original booking script
+MAX_SCHEDULE_DAYS = 366
+MAX_SEARCH_DAYS = 31
+
+def train_stops(train):
+    # traind rows are (tid, train_name, destination1, destination2, destination3)
+    return [ORIGIN_STATION] + [stop for stop in train[2:5] if stop]
+
+def all_stations(trains):
+    stations = []
+    for train in trains:
+        for stop in train_stops(train):
+            if stop not in stations:
+                stations.append(stop)
+    return stations
+
+def find_segment_range(stops, boarding_point, destination):
+    # Returns the (first, last) segment numbers covering the journey, or None
+    if boarding_point not in stops or destination not in stops:
+        return None
+    first = stops.index(boarding_point)
+    last = stops.index(destination) - 1
+    if last < first:
+        return None
+    return first, last
+
+def journey_fare(destinations, boarding_point, destination_cost):
+    # desti costs are fares from the origin, so a journey that boards further
+    # down the line pays the difference. Returns None if it cannot be priced.
+    if boarding_point == ORIGIN_STATION:
+        return destination_cost
+    boarding = next((d for d in destinations if d[1] == boarding_point), None)
+    if not boarding or destination_cost <= boarding[2]:
+        return None
+    return destination_cost - boarding[2]
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def insert_run_segments(cursor, run_id, stops):
+    sql = "INSERT INTO run_segment (run_id, seg_no, from_stop, to_stop) VALUES (%s, %s, %s, %s)"
+    cursor.executemany(sql, [(run_id, n, stops[n], stops[n + 1]) for n in range(len(stops) - 1)])
+
+def run_stops(cursor, run_id):
+    # Locking read, so callers holding the run lock see the latest stop layout
+    # rather than their transaction's older snapshot
+    sql = "SELECT from_stop, to_stop FROM run_segment WHERE run_id = %s ORDER BY seg_no FOR SHARE"
+    cursor.execute(sql, (run_id,))
+    segments = cursor.fetchall()
+    if not segments:
+        return []
+    return [segments[0][0]] + [segment[1] for segment in segments]
+
+def reserve_seats(cursor, run_id, seg_range, tickets):
+    # Each segment is only incremented while it stays within capacity, so a
+    # short row count means the journey does not fit; the caller rolls back.
+    sql = """
+        UPDATE run_segment s JOIN train_run r ON r.run_id = s.run_id
+        SET s.seats_booked = s.seats_booked + %s
+        WHERE s.run_id = %s AND s.seg_no BETWEEN %s AND %s
+          AND s.seats_booked + %s <= r.capacity
+    """
+    cursor.execute(sql, (tickets, run_id, seg_range[0], seg_range[1], tickets))
+    return cursor.rowcount == seg_range[1] - seg_range[0] + 1
+
+def release_seats(cursor, run_id, seg_range, tickets):
+    sql = """
+        UPDATE run_segment SET seats_booked = GREATEST(seats_booked - %s, 0)
+        WHERE run_id = %s AND seg_no BETWEEN %s AND %s
+    """
+    cursor.execute(sql, (tickets, run_id, seg_range[0], seg_range[1]))
+
+def find_available_runs(cursor, from_station, to_station, start_date, end_date, tickets):
+    # Single query over the date range: segment a starts at the boarding point,
+    # segment b ends at the destination, and s is every segment in between.
+    sql = """
+        SELECT r.run_id, r.tid, t.train_name, r.run_date,
+               r.capacity - MAX(s.seats_booked) AS seats_left
+        FROM train_run r
+        JOIN traind t ON t.tid = r.tid
+        JOIN run_segment a ON a.run_id = r.run_id AND a.from_stop = %s
+        JOIN run_segment b ON b.run_id = r.run_id AND b.to_stop = %s AND b.seg_no >= a.seg_no
+        JOIN run_segment s ON s.run_id = r.run_id AND s.seg_no BETWEEN a.seg_no AND b.seg_no
+        WHERE r.run_date BETWEEN %s AND %s
+        GROUP BY r.run_id, r.tid, t.train_name, r.run_date, r.capacity
+        HAVING seats_left >= %s
+        ORDER BY r.run_date, t.train_name
+    """
+    cursor.execute(sql, (from_station, to_station, start_date, end_date, tickets))
+    return cursor.fetchall()
+
+def rebuild_unbooked_runs(cursor, train):
+    # Runs without bookings follow the train's new stops; booked runs keep theirs.
+    # The runs are locked first so no booking can land between check and rebuild.
+    cursor.execute("SELECT run_id FROM train_run WHERE tid = %s FOR UPDATE", (train[0],))
+    cursor.fetchall()
+    sql = """
+        SELECT r.run_id FROM train_run r
+        WHERE r.tid = %s AND NOT EXISTS (SELECT 1 FROM passenger p WHERE p.run_id = r.run_id)
+    """
+    cursor.execute(sql, (train[0],))
+    stops = train_stops(train)
+    for (run_id,) in cursor.fetchall():
+        cursor.execute("DELETE FROM run_segment WHERE run_id = %s", (run_id,))
+        insert_run_segments(cursor, run_id, stops)
+
+@app.route('/search_trains')
+def search_trains():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+
+    con = get_db_connection()
+    if not con:
+        flash('Database connection error.', 'error')
+        return redirect(url_for('dashboard'))
+
+    stations = []
+    results = None
+    try:
+        xo = con.cursor()
+        xo.execute("SELECT * FROM traind")
+        stations = all_stations(xo.fetchall())
+
+        if request.args.get('from_station'):
+            try:
+                from_station = request.args['from_station']
+                to_station = request.args['to_station']
+                start_date = parse_date(request.args['start_date'])
+                end_date = parse_date(request.args.get('end_date') or request.args['start_date'])
+                tickets = int(request.args.get('num_tickets', 1))
+
+                if from_station == to_station:
+                    flash("Boarding point and destination must be different.", 'error')
+                elif start_date < date.today() or end_date < start_date:
+                    flash("Please choose a date range that starts today or later.", 'error')
+                elif (end_date - start_date).days >= MAX_SEARCH_DAYS:
+                    flash(f"Please search at most {MAX_SEARCH_DAYS} days at a time.", 'error')
+                elif tickets <= 0:
+                    flash("Number of tickets must be positive.", 'error')
+                else:
+                    results = find_available_runs(xo, from_station, to_station, start_date, end_date, tickets)
+            except (KeyError, ValueError):
+                flash("Please enter valid stations, dates and number of tickets.", 'error')
+    except mysql.Error as e:
+        flash(f"Error searching trains: {e}", 'error')
+    finally:
+        if con.is_connected():
+            con.close()
+    return render_template('search_trains.html', stations=stations, results=results)
+
+@app.route('/show_schedule')
+@requires_roles('manager')
+def show_schedule():
+    con = get_db_connection()
+    if not con:
+        flash('Database connection error.', 'error')
+        return redirect(url_for('dashboard'))
+
+    runs = []
+    trains = []
+    try:
+        xo = con.cursor()
+        xo.execute("SELECT * FROM traind")
+        trains = xo.fetchall()
+        sql = """
+            SELECT r.run_id, r.tid, t.train_name, r.run_date, r.capacity, COALESCE(MAX(s.seats_booked), 0)
+            FROM train_run r
+            JOIN traind t ON t.tid = r.tid
+            LEFT JOIN run_segment s ON s.run_id = r.run_id
+            WHERE r.run_date >= CURRENT_DATE
+            GROUP BY r.run_id, r.tid, t.train_name, r.run_date, r.capacity
+            ORDER BY r.run_date, t.train_name
+        """
+        xo.execute(sql)
+        runs = xo.fetchall()
+    except mysql.Error as e:
+        flash(f"Error fetching schedule: {e}", 'error')
+    finally:
+        if con.is_connected():
+            con.close()
+    return render_template('show_schedule.html', runs=runs, trains=trains)
+
+@app.route('/schedule_train', methods=['POST'])
+@requires_roles('manager')
+def schedule_train():
+    try:
+        tid = int(request.form['train_id'])
+        start_date = parse_date(request.form['start_date'])
+        end_date = parse_date(request.form['end_date'])
+        capacity = int(request.form['capacity'])
+    except ValueError:
+        flash("Please enter a valid train, dates and seat capacity.", 'error')
+        return redirect(url_for('show_schedule'))
+
+    if start_date < date.today() or end_date < start_date:
+        flash("Please choose a date range that starts today or later.", 'error')
+        return redirect(url_for('show_schedule'))
+    if (end_date - start_date).days >= MAX_SCHEDULE_DAYS:
+        flash(f"Please schedule at most {MAX_SCHEDULE_DAYS} days at a time.", 'error')
+        return redirect(url_for('show_schedule'))
+    if capacity <= 0:
+        flash("Seat capacity must be positive.", 'error')
+        return redirect(url_for('show_schedule'))
+
+    con = get_db_connection()
+    if not con:
+        flash('Database connection error.', 'error')
+        return redirect(url_for('show_schedule'))
+
+    try:
+        cursor = con.cursor()
+        cursor.execute("SELECT * FROM traind WHERE tid = %s", (tid,))
+        train = cursor.fetchone()
+        if not train:
+            flash('Train not found.', 'error')
+            return redirect(url_for('show_schedule'))
+
+        stops = train_stops(train)
+        if len(stops) < 2:
+            flash(f'{train[1]} has no destinations to run to.', 'error')
+            return redirect(url_for('show_schedule'))
+
+        added = 0
+        run_date = start_date
+        while run_date <= end_date:
+            # Dates the train already runs on are left untouched
+            sql = "INSERT IGNORE INTO train_run (tid, run_date, capacity) VALUES (%s, %s, %s)"
+            cursor.execute(sql, (tid, run_date, capacity))
+            if cursor.rowcount == 1:
+                insert_run_segments(cursor, cursor.lastrowid, stops)
+                added += 1
+            run_date += timedelta(days=1)
+        con.commit()
+        flash(f'{added} run(s) scheduled for {train[1]}.', 'success')
+    except mysql.Error as e:
+        con.rollback()
+        flash(f"Error scheduling train: {e}", 'error')
+    finally:
+        if con.is_connected():
+            con.close()
+    return redirect(url_for('show_schedule'))
+
+@app.route('/delete_run/<int:run_id>')
+@requires_roles('manager')
+def delete_run(run_id):
+    con = get_db_connection()
+    if not con:
+        flash('Database connection error.', 'error')
+        return redirect(url_for('show_schedule'))
+
+    try:
+        cursor = con.cursor()
+        # Lock the run as book_ticket does, so no booking commits while we check
+        cursor.execute("SELECT run_id FROM train_run WHERE run_id = %s FOR UPDATE", (run_id,))
+        cursor.fetchall()
+
+        sql = "SELECT COUNT(*) FROM passenger WHERE run_id = %s"
+        cursor.execute(sql, (run_id,))
+        count = cursor.fetchone()[0]
+
+        if count > 0:
+            flash(f'Cannot cancel run. There are {count} passengers booked on it.', 'error')
+            return redirect(url_for('show_schedule'))
+
+        cursor.execute("DELETE FROM run_segment WHERE run_id = %s", (run_id,))
+        cursor.execute("DELETE FROM train_run WHERE run_id = %s", (run_id,))
+        con.commit()
+        flash('Run cancelled successfully.', 'success')
+    except mysql.Error as e:
+        con.rollback()
+        flash(f"Error cancelling run: {e}", 'error')
+    finally:
+        if con.is_connected():
+            con.close()
+    return redirect(url_for('show_schedule'))
+
 
 # --- Made By ---
 @app.route('/made_by')
@@ -349,11 +663,23 @@ def delete_passenger(pno):
 
     try:
         cursor = con.cursor()
+        # Lock the booking so concurrent deletes cannot release its seats twice
+        sql = "SELECT run_id, startingpoint, destination, tickets FROM passenger WHERE pno = %s FOR UPDATE"
+        cursor.execute(sql, (pno,))
+        booking = cursor.fetchone()
+
+        # Give the passenger's seats back to the run they were booked on
+        if booking and booking[0] is not None:
+            seg_range = find_segment_range(run_stops(cursor, booking[0]), booking[1], booking[2])
+            if seg_range:
+                release_seats(cursor, booking[0], seg_range, booking[3])
+
         sql = "DELETE FROM passenger WHERE pno = %s"
         cursor.execute(sql, (pno,))
         con.commit()
         flash('Passenger deleted successfully.', 'success')
     except mysql.Error as e:
+        con.rollback()
         flash(f"Error deleting passenger: {e}", 'error')
     finally:
         if con.is_connected():
@@ -460,6 +786,7 @@ def edit_train(tid):
                 WHERE tid = %s
             """
             cursor.execute(sql, (train_name, dest1, dest2, dest3, tid))
+            rebuild_unbooked_runs(cursor, (tid, train_name, dest1, dest2, dest3))
             con.commit()
             flash('Train details updated successfully.', 'success')
             return redirect(url_for('show_train_details'))
@@ -500,8 +827,12 @@ def delete_train(tid):
         return redirect(url_for('show_train_details'))
 
     try:
-        # First check if there are any passengers booked on this train
+        # Lock the train's runs as book_ticket does, so no booking commits while we check
         cursor = con.cursor()
+        cursor.execute("SELECT run_id FROM train_run WHERE tid = %s FOR UPDATE", (tid,))
+        cursor.fetchall()
+
+        # First check if there are any passengers booked on this train
         sql = "SELECT COUNT(*) FROM passenger WHERE tid = %s"
         cursor.execute(sql, (tid,))
         count = cursor.fetchone()[0]
@@ -510,11 +841,17 @@ def delete_train(tid):
             flash(f'Cannot delete train. There are {count} passengers booked on this train.', 'error')
             return redirect(url_for('show_train_details'))
 
+        sql = "DELETE FROM run_segment WHERE run_id IN (SELECT run_id FROM train_run WHERE tid = %s)"
+        cursor.execute(sql, (tid,))
+        sql = "DELETE FROM train_run WHERE tid = %s"
+        cursor.execute(sql, (tid,))
+
         sql = "DELETE FROM traind WHERE tid = %s"
         cursor.execute(sql, (tid,))
         con.commit()
         flash('Train deleted successfully.', 'success')
     except mysql.Error as e:
+        con.rollback()
         flash(f"Error deleting train: {e}", 'error')
     finally:
         if con.is_connected():